@@ -0,0 +1,239 @@
+"""
+Image Cache
+
+Two-tier cache for proxied images. Small images live in an in-memory LRU,
+larger ones are written to disk under PROXY_CACHE_DIR. Entries are keyed by
+the sha256 of the upstream URL and carry a small metadata dict (content type
+and the upstream ETag/Last-Modified validators).
+
+Both tiers expire entries after MAX_AGE seconds. The disk tier is capped by
+total bytes and entry count and evicts least recently used entries; a body's
+mtime records when it was stored and its metadata file's mtime when it was
+last served. Disk I/O runs in worker threads so the event loop never blocks.
+"""
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import anyio.to_thread
+import orjson
+
+# Matches the max-age the proxy advertises to clients
+MAX_AGE = 86400
+
+MEMORY_MAX_ENTRIES = 256
+MEMORY_MAX_ITEM_BYTES = 256 * 1024
+DISK_MAX_ITEM_BYTES = 10 * 1024 * 1024
+DISK_MAX_BYTES = int(os.getenv("PROXY_CACHE_MAX_BYTES", 512 * 1024 * 1024))
+DISK_MAX_ENTRIES = int(os.getenv("PROXY_CACHE_MAX_ENTRIES", 4096))
+
+CACHE_DIR = os.getenv("PROXY_CACHE_DIR", "/tmp/proxy_cache")
+
+# Partial writes left behind by a crashed process are removed after this long
+_STALE_TMP_AGE = 3600
+
+# key -> (stored_at, metadata, body); most recently used entries are at the end
+_memory: "OrderedDict[str, Tuple[float, dict, bytes]]" = OrderedDict()
+
+
+def cache_key(url: str) -> str:
+    """Stable cache key for an upstream URL"""
+    return hashlib.sha256(url.encode("utf-8")).hexdigest()
+
+
+def _body_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key)
+
+
+def _meta_path(key: str) -> str:
+    return os.path.join(CACHE_DIR, key + ".json")
+
+
+def _remove(*paths: str) -> None:
+    for path in paths:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+def _evict(key: str) -> None:
+    # Metadata first, so the entry stops being visible before the body goes
+    _remove(_meta_path(key), _body_path(key))
+
+
+async def get(key: str) -> Optional[Tuple[dict, Optional[bytes], Optional[str]]]:
+    """Look up an image. Returns (metadata, body, path) where exactly one of
+    body (memory hit) or path (disk hit) is set, or None on a miss."""
+    entry = _memory.get(key)
+    if entry is not None:
+        stored_at, meta, body = entry
+        if time.monotonic() - stored_at < MAX_AGE:
+            _memory.move_to_end(key)
+            return meta, body, None
+        del _memory[key]
+    return await anyio.to_thread.run_sync(_get_disk, key)
+
+
+def _get_disk(key: str) -> Optional[Tuple[dict, None, str]]:
+    meta_path = _meta_path(key)
+    path = _body_path(key)
+    # The metadata file is written last, so its presence means the body is complete
+    try:
+        with open(meta_path, "rb") as f:
+            meta = orjson.loads(f.read())
+        stored_at = os.stat(path).st_mtime
+    except (OSError, ValueError):
+        return None
+    if time.time() - stored_at >= MAX_AGE:
+        _evict(key)
+        return None
+    try:
+        # Mark as recently used for eviction
+        os.utime(meta_path)
+    except OSError:
+        pass
+    return meta, None, path
+
+
+def iter_file(path: str, chunk_size: int = 65536):
+    """Read a cached body in chunks; Starlette iterates this in a worker thread"""
+    with open(path, "rb") as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+def put(key: str, body: bytes, meta: dict) -> None:
+    """Store a small image in the in-memory LRU"""
+    if len(body) > MEMORY_MAX_ITEM_BYTES:
+        return
+    _memory[key] = (time.monotonic(), meta, body)
+    _memory.move_to_end(key)
+    while len(_memory) > MEMORY_MAX_ENTRIES:
+        _memory.popitem(last=False)
+
+
+def _prune() -> None:
+    """Drop expired entries, then least recently used ones until the disk tier
+    is within DISK_MAX_BYTES and DISK_MAX_ENTRIES."""
+    now = time.time()
+    entries = []
+    total = 0
+    try:
+        names = os.listdir(CACHE_DIR)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(CACHE_DIR, name)
+        if name.endswith(".tmp") or name.endswith(".tmp.json"):
+            try:
+                if now - os.stat(path).st_mtime > _STALE_TMP_AGE:
+                    _remove(path)
+            except OSError:
+                pass
+            continue
+        if not name.endswith(".json"):
+            continue
+        key = name[: -len(".json")]
+        try:
+            used_at = os.stat(path).st_mtime
+            body = os.stat(_body_path(key))
+        except OSError:
+            continue
+        if now - body.st_mtime >= MAX_AGE:
+            _evict(key)
+            continue
+        entries.append((used_at, key, body.st_size))
+        total += body.st_size
+
+    entries.sort()
+    count = len(entries)
+    for _, key, size in entries:
+        if total <= DISK_MAX_BYTES and count <= DISK_MAX_ENTRIES:
+            break
+        _evict(key)
+        total -= size
+        count -= 1
+
+
+class DiskWriter:
+    """Write a streamed image to the disk cache as chunks pass through.
+
+    Call open() first; the entry only becomes visible after commit(), and
+    close() discards a partial write. Disk errors, or a body larger than
+    DISK_MAX_ITEM_BYTES, disable the writer instead of failing the response.
+    """
+
+    def __init__(self, key: str, meta: dict):
+        self.key = key
+        self.meta = meta
+        self._tmp_path = _body_path(key) + f".{os.getpid()}.{id(self)}.tmp"
+        self._file = None
+        self._written = 0
+
+    @property
+    def active(self) -> bool:
+        return self._file is not None
+
+    async def open(self) -> bool:
+        await anyio.to_thread.run_sync(self._open)
+        return self.active
+
+    def _open(self) -> None:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            self._file = open(self._tmp_path, "wb")
+        except OSError:
+            self._file = None
+
+    async def write(self, chunk: bytes) -> None:
+        if self._file is None:
+            return
+        self._written += len(chunk)
+        if self._written > DISK_MAX_ITEM_BYTES:
+            await self.close()
+            return
+        await anyio.to_thread.run_sync(self._write, chunk)
+
+    def _write(self, chunk: bytes) -> None:
+        try:
+            self._file.write(chunk)
+        except OSError:
+            self._close()
+
+    async def commit(self) -> None:
+        if self._file is None:
+            return
+        await anyio.to_thread.run_sync(self._commit)
+
+    def _commit(self) -> None:
+        try:
+            self._file.close()
+            self._file = None
+            os.replace(self._tmp_path, _body_path(self.key))
+            meta_tmp = self._tmp_path + ".json"
+            with open(meta_tmp, "wb") as f:
+                f.write(orjson.dumps(self.meta))
+            os.replace(meta_tmp, _meta_path(self.key))
+        except OSError:
+            self._close()
+            return
+        _prune()
+
+    async def close(self) -> None:
+        await anyio.to_thread.run_sync(self._close)
+
+    def _close(self) -> None:
+        if self._file is not None:
+            try:
+                self._file.close()
+            except OSError:
+                pass
+            self._file = None
+        _remove(self._tmp_path)
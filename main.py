@@ -1,15 +1,32 @@
+import asyncio
+import logging
 import os
-from fastapi import FastAPI, HTTPException, Query
+import re
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse, Response
-from pydantic import BaseModel
-from typing import List, Optional
-import requests
+from starlette.background import BackgroundTask
+from fastapi.responses import ORJSONResponse, StreamingResponse, Response
+from typing import Annotated, List, Optional
+import httpx
+import msgspec
+import orjson
+from bson import ObjectId
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from cachetools import TTLCache
+from email_validator import EmailNotValidError, validate_email
 
-from database import db, create_document, get_documents
-from schemas import Product, Message
+import image_cache
+from database import db, async_db, find_documents_async
+from schemas import Product
 
-app = FastAPI(title="momtobe API")
+logger = logging.getLogger(__name__)
+
+app = FastAPI(title="momtobe API", default_response_class=ORJSONResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -19,172 +36,663 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Constant body, encoded once; "/" is commonly used as a liveness probe
+_ROOT_BODY = orjson.dumps({"name": "momtobe", "message": "API running"})
+
+
 @app.get("/")
 def read_root():
-    return {"name": "momtobe", "message": "API running"}
+    return Response(content=_ROOT_BODY, media_type="application/json")
 
 
-def _seed_products_if_empty():
-    try:
-        if db is None:
+_SAMPLE_PRODUCTS = (
+    {
+        "_id": ObjectId("65f0c0de0000000000000001"),
+        "title": "Комфортное платье для будущих мам",
+        "description": "Мягкое трикотажное платье с растущей талией.",
+        "price": 59.99,
+        "category": "Платья",
+        "in_stock": True,
+        "image_url": "https://images.unsplash.com/photo-1556898578-c07eaed1f7f7?q=80&w=1200&auto=format&fit=crop",
+        "sizes": ["S", "M", "L", "XL"],
+        "is_featured": True,
+    },
+    {
+        "_id": ObjectId("65f0c0de0000000000000002"),
+        "title": "Джинсы для беременных",
+        "description": "Эластичный пояс, удобная посадка и прочная ткань.",
+        "price": 69.99,
+        "category": "Джинсы",
+        "in_stock": True,
+        "image_url": "https://images.unsplash.com/photo-1515378791036-0648a3ef77b2?q=80&w=1200&auto=format&fit=crop",
+        "sizes": ["S", "M", "L"],
+        "is_featured": True,
+    },
+    {
+        "_id": ObjectId("65f0c0de0000000000000003"),
+        "title": "Футболка Basic",
+        "description": "Дышащий хлопок, свободный крой для живота.",
+        "price": 24.99,
+        "category": "Топы",
+        "in_stock": True,
+        "image_url": "https://images.unsplash.com/photo-1512436991641-6745cdb1723f?q=80&w=1200&auto=format&fit=crop",
+        "sizes": ["S", "M", "L", "XL"],
+        "is_featured": False,
+    },
+    {
+        "_id": ObjectId("65f0c0de0000000000000004"),
+        "title": "Теплый кардиган",
+        "description": "Мягкий оверсайз-кардиган на осень и зиму.",
+        "price": 89.0,
+        "category": "Верхняя одежда",
+        "in_stock": True,
+        "image_url": "https://images.unsplash.com/photo-1515378791036-0648a3ef77b2?q=80&w=1200&auto=format&fit=crop",
+        "sizes": ["M", "L"],
+        "is_featured": False,
+    },
+)
+
+# The samples are hand-written constants with every Product field spelled out,
+# so they are inserted as-is. Fixed _ids make seeding idempotent: workers that
+# seed concurrently collide on _id instead of inserting duplicate products. Validating them here still fails fast on schema
+# drift during development; running under python -O skips the check.
+if __debug__:
+    for _sample in _SAMPLE_PRODUCTS:
+        Product(**_sample)
+
+_PRODUCT_SETUP_RETRY_DELAY = 10.0
+_product_setup: Optional[asyncio.Task] = None
+
+
+async def _seed_products_if_empty():
+    # Metadata-based count is enough to tell whether the collection is empty
+    count = await async_db["product"].estimated_document_count()
+    if count == 0:
+        now = datetime.now(timezone.utc)
+        docs = [{**d, "created_at": now, "updated_at": now} for d in _SAMPLE_PRODUCTS]
+        try:
+            # Unordered bulk insert: one round-trip, individual failures don't stop the rest
+            await async_db["product"].insert_many(docs, ordered=False)
+        except BulkWriteError as e:
+            # Another worker already inserted the same fixed _id
+            if any(err.get("code") != 11000 for err in e.details.get("writeErrors", [])):
+                logger.exception("Some sample products could not be seeded")
+        _products_cache.clear()
+
+
+async def _ensure_product_indexes():
+    """Index the /api/products filter shapes so queries avoid a collection scan."""
+    await async_db["product"].create_index([("category", 1), ("is_featured", 1)])
+    await async_db["product"].create_index([("is_featured", 1)])
+
+
+async def _prepare_products():
+    """Create indexes and seed sample products, retrying until Mongo is reachable"""
+    while True:
+        try:
+            await _ensure_product_indexes()
+            await _seed_products_if_empty()
             return
-        count = db["product"].count_documents({})
-        if count == 0:
-            sample_products = [
-                {
-                    "title": "Комфортное платье для будущих мам",
-                    "description": "Мягкое трикотажное платье с растущей талией.",
-                    "price": 59.99,
-                    "category": "Платья",
-                    "in_stock": True,
-                    "image_url": "https://images.unsplash.com/photo-1556898578-c07eaed1f7f7?q=80&w=1200&auto=format&fit=crop",
-                    "sizes": ["S", "M", "L", "XL"],
-                    "is_featured": True,
-                },
-                {
-                    "title": "Джинсы для беременных",
-                    "description": "Эластичный пояс, удобная посадка и прочная ткань.",
-                    "price": 69.99,
-                    "category": "Джинсы",
-                    "in_stock": True,
-                    "image_url": "https://images.unsplash.com/photo-1515378791036-0648a3ef77b2?q=80&w=1200&auto=format&fit=crop",
-                    "sizes": ["S", "M", "L"],
-                    "is_featured": True,
-                },
-                {
-                    "title": "Футболка Basic",
-                    "description": "Дышащий хлопок, свободный крой для живота.",
-                    "price": 24.99,
-                    "category": "Топы",
-                    "in_stock": True,
-                    "image_url": "https://images.unsplash.com/photo-1512436991641-6745cdb1723f?q=80&w=1200&auto=format&fit=crop",
-                    "sizes": ["S", "M", "L", "XL"],
-                    "is_featured": False,
-                },
-                {
-                    "title": "Теплый кардиган",
-                    "description": "Мягкий оверсайз-кардиган на осень и зиму.",
-                    "price": 89.0,
-                    "category": "Верхняя одежда",
-                    "in_stock": True,
-                    "image_url": "https://images.unsplash.com/photo-1515378791036-0648a3ef77b2?q=80&w=1200&auto=format&fit=crop",
-                    "sizes": ["M", "L"],
-                    "is_featured": False,
-                },
-            ]
-            for p in sample_products:
-                try:
-                    create_document("product", Product(**p))
-                except Exception:
-                    # Ignore individual failures while seeding
-                    pass
-    except Exception:
-        pass
-
-
-@app.get("/api/products", response_model=List[Product])
-def list_products(category: Optional[str] = None, featured: Optional[bool] = None):
-    """List products with optional filters. Seeds defaults if collection empty."""
-    _seed_products_if_empty()
+        except Exception:
+            logger.exception("Product collection setup failed, retrying in %.0fs", _PRODUCT_SETUP_RETRY_DELAY)
+            await asyncio.sleep(_PRODUCT_SETUP_RETRY_DELAY)
+
+
+@app.on_event("startup")
+async def prepare_products():
+    """Seed and index products in the background so startup never waits on Mongo."""
+    global _product_setup
+    if async_db is None:
+        return
+    _product_setup = asyncio.create_task(_prepare_products())
+
+
+@app.on_event("shutdown")
+async def stop_product_setup():
+    if _product_setup is not None and not _product_setup.done():
+        _product_setup.cancel()
+
+
+# Only ship the public Product fields; Mongo never sends _id or timestamps
+_PRODUCT_PROJECTION = {"_id": 0, **{name: 1 for name in Product.model_fields}}
+
+# Serialized /api/products bodies keyed by (category, featured)
+_products_cache = TTLCache(maxsize=64, ttl=60)
+# Larger result sets are streamed without being retained for the cache
+_PRODUCTS_CACHE_MAX_BYTES = 1024 * 1024
+_STREAM_CHUNK_BYTES = 64 * 1024
+
+
+@app.get("/api/products", responses={200: {"model": List[Product]}})
+async def list_products(category: Optional[str] = None, featured: Optional[bool] = None):
+    """List products with optional filters. Defaults are seeded at startup.
+    Results are streamed as a JSON array while the cursor is read.
+    """
+    key = (category or None, featured)
+    body = _products_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type="application/json")
     filt = {}
     if category:
         filt["category"] = category
     if featured is not None:
         filt["is_featured"] = featured
     try:
-        items = get_documents("product", filt)
-        products: List[Product] = []
-        for d in items:
-            d.pop("_id", None)
-            products.append(Product(**d))
-        return products
+        cursor = find_documents_async("product", filt, _PRODUCT_PROJECTION)
+        # Fetch the first batch up front so connection errors still surface as a 500
+        try:
+            first = await cursor.next()
+        except StopAsyncIteration:
+            first = None
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+    if first is None:
+        _products_cache[key] = b"[]"
+        return Response(content=b"[]", media_type="application/json")
+
+    async def stream_products():
+        # Documents were validated on insert, so encode them as plain dicts
+        # Chunks kept for the cache until the body outgrows it
+        parts = []
+        size = 0
+        buf = bytearray(b"[")
+        buf += orjson.dumps(first)
+        async for d in cursor:
+            buf += b","
+            buf += orjson.dumps(d)
+            if len(buf) >= _STREAM_CHUNK_BYTES:
+                chunk = bytes(buf)
+                buf.clear()
+                if parts is not None:
+                    size += len(chunk)
+                    if size > _PRODUCTS_CACHE_MAX_BYTES:
+                        parts = None
+                    else:
+                        parts.append(chunk)
+                yield chunk
+        buf += b"]"
+        chunk = bytes(buf)
+        if parts is not None and size + len(chunk) <= _PRODUCTS_CACHE_MAX_BYTES:
+            parts.append(chunk)
+            _products_cache[key] = b"".join(parts)
+        yield chunk
 
-class ContactRequest(BaseModel):
+    return StreamingResponse(stream_products(), media_type="application/json")
+
+
+class ContactRequest(msgspec.Struct):
+    """Contact form body, decoded and validated by msgspec in a single pass.
+    Mirrors the Message schema; email is checked with email_validator after decoding.
+    """
     name: str
     email: str
-    message: str
+    message: Annotated[str, msgspec.Meta(min_length=5, max_length=2000)]
 
 
-@app.post("/api/contact")
-def contact(data: ContactRequest):
+_contact_decoder = msgspec.json.Decoder(ContactRequest)
+_json_encoder = msgspec.json.Encoder()
+
+# The body is parsed by hand, so describe it to OpenAPI explicitly
+_CONTACT_SCHEMA = msgspec.json.schema_components(
+    [ContactRequest], ref_template="#/components/schemas/{name}"
+)[1]["ContactRequest"]
+
+
+def _contact_error(type_: str, loc: tuple, msg: str) -> RequestValidationError:
+    """A single-entry 422 error in FastAPI's {"detail": [...]} list shape"""
+    return RequestValidationError([{"type": type_, "loc": loc, "msg": msg}])
+
+
+@app.post(
+    "/api/contact",
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {"application/json": {"schema": _CONTACT_SCHEMA}},
+        }
+    },
+    responses={
+        422: {
+            "description": (
+                "Invalid body. detail holds one error: type \"json_invalid\" for malformed "
+                "JSON, \"body_invalid\" for a schema violation (msg names the field) "
+                "with loc [\"body\"], or \"value_error\" with loc [\"body\", \"email\"] "
+                "for an invalid email address."
+            ),
+        }
+    },
+)
+async def contact(request: Request):
+    """Validate a contact message and queue it; the write happens in the background."""
     try:
-        msg = Message(**data.model_dump())
-        _id = create_document("message", msg)
-        return {"status": "ok", "id": _id}
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        data = _contact_decoder.decode(await request.body())
+    except msgspec.ValidationError as e:
+        raise _contact_error("body_invalid", ("body",), str(e))
+    except msgspec.DecodeError as e:
+        raise _contact_error("json_invalid", ("body",), str(e))
+    try:
+        # Same check and normalization EmailStr applies in schemas.Message
+        email = validate_email(data.email, check_deliverability=False).normalized
+    except EmailNotValidError as e:
+        raise _contact_error("value_error", ("body", "email"), str(e))
+    if _message_queue is None:
+        raise HTTPException(
+            status_code=500,
+            detail="Database not available. Check DATABASE_URL and DATABASE_NAME environment variables.",
+        )
+    now = datetime.now(timezone.utc)
+    # The id is assigned here so it can be returned before the document is written
+    doc = {
+        "name": data.name,
+        "email": email,
+        "message": data.message,
+        "_id": ObjectId(),
+        "created_at": now,
+        "updated_at": now,
+    }
+    try:
+        _message_queue.put_nowait(doc)
+    except asyncio.QueueFull:
+        raise HTTPException(status_code=503, detail="Too many pending messages, try again later")
+    return Response(content=_json_encoder.encode({"status": "ok", "id": str(doc["_id"])}), media_type="application/json")
+
+
+_MESSAGE_BATCH_SIZE = 100
+_MESSAGE_FLUSH_INTERVAL = 0.25
+_MESSAGE_QUEUE_MAX = 10000
+_MESSAGE_WRITE_ATTEMPTS = 3
+_MESSAGE_RETRY_DELAY = 1.0
+# Well under the usual orchestrator grace period before SIGKILL
+_MESSAGE_SHUTDOWN_TIMEOUT = float(os.getenv("MESSAGE_SHUTDOWN_TIMEOUT", 10))
+
+# Created at startup when a database is configured; None is the stop sentinel
+_message_queue: Optional[asyncio.Queue] = None
+_message_flusher: Optional[asyncio.Task] = None
+
+
+def _message_ids(docs: list) -> str:
+    return ", ".join(str(d["_id"]) for d in docs)
+
+
+async def _write_messages(batch: list, requeue: bool = True):
+    """Insert queued messages. Connection failures are retried with backoff and
+    the batch is then requeued; only documents Mongo rejects are dropped."""
+    for attempt in range(_MESSAGE_WRITE_ATTEMPTS):
+        try:
+            await async_db["message"].insert_many(batch, ordered=False)
+            return
+        except BulkWriteError as e:
+            # Ids are assigned before queuing, so a duplicate key means an
+            # earlier attempt already stored that message
+            for err in e.details.get("writeErrors", []):
+                if err.get("code") != 11000:
+                    logger.error(
+                        "Dropping contact message %s: %s", batch[err["index"]]["_id"], err.get("errmsg")
+                    )
+            return
+        except PyMongoError as e:
+            if not (isinstance(e, ConnectionFailure) or e.has_error_label("RetryableWriteError")):
+                logger.exception("Dropping contact messages %s", _message_ids(batch))
+                return
+            logger.warning(
+                "Writing %d contact messages failed (attempt %d of %d)",
+                len(batch), attempt + 1, _MESSAGE_WRITE_ATTEMPTS, exc_info=True,
+            )
+            if attempt + 1 < _MESSAGE_WRITE_ATTEMPTS:
+                await asyncio.sleep(_MESSAGE_RETRY_DELAY * 2 ** attempt)
+
+    if requeue:
+        for i, doc in enumerate(batch):
+            try:
+                _message_queue.put_nowait(doc)
+            except asyncio.QueueFull:
+                logger.error("Message queue full, dropping contact messages %s", _message_ids(batch[i:]))
+                return
+        return
+    logger.error("Could not store contact messages %s", _message_ids(batch))
+
+
+async def _flush_messages():
+    """Batch queued contact messages into insert_many calls of up to
+    _MESSAGE_BATCH_SIZE documents or every _MESSAGE_FLUSH_INTERVAL seconds."""
+    loop = asyncio.get_running_loop()
+    while True:
+        doc = await _message_queue.get()
+        if doc is None:
+            return
+        batch = [doc]
+        deadline = loop.time() + _MESSAGE_FLUSH_INTERVAL
+        stopping = False
+        while len(batch) < _MESSAGE_BATCH_SIZE:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                doc = await asyncio.wait_for(_message_queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if doc is None:
+                stopping = True
+                break
+            batch.append(doc)
+        try:
+            await _write_messages(batch)
+        except asyncio.CancelledError:
+            logger.error("Cancelled while storing contact messages %s", _message_ids(batch))
+            raise
+        except Exception:
+            # e.g. bson InvalidDocument; keep the flusher alive for later messages
+            logger.exception("Dropping contact messages %s", _message_ids(batch))
+        if stopping:
+            return
+
+
+@app.on_event("startup")
+async def start_message_flusher():
+    global _message_queue, _message_flusher
+    if async_db is None:
+        return
+    _message_queue = asyncio.Queue(maxsize=_MESSAGE_QUEUE_MAX)
+    _message_flusher = asyncio.create_task(_flush_messages())
+
+
+async def _drain_messages():
+    await _message_queue.put(None)
+    await _message_flusher
+    remaining = []
+    while not _message_queue.empty():
+        doc = _message_queue.get_nowait()
+        if doc is not None:
+            remaining.append(doc)
+    if remaining:
+        try:
+            await _write_messages(remaining, requeue=False)
+        except asyncio.CancelledError:
+            logger.error("Cancelled while storing contact messages %s", _message_ids(remaining))
+            raise
+
+
+@app.on_event("shutdown")
+async def stop_message_flusher():
+    """Write out everything still queued, within _MESSAGE_SHUTDOWN_TIMEOUT seconds"""
+    if _message_flusher is None:
+        return
+    try:
+        await asyncio.wait_for(_drain_messages(), _MESSAGE_SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        _message_flusher.cancel()
+        lost = []
+        while not _message_queue.empty():
+            doc = _message_queue.get_nowait()
+            if doc is not None:
+                lost.append(doc)
+        if lost:
+            logger.error("Shutdown timed out, contact messages not stored: %s", _message_ids(lost))
+
+
+# Hosts the image proxy may fetch from; extend with PROXY_ALLOWED_HOSTS=host1,host2
+_ALLOWED_HOSTS = frozenset(
+    h.strip().lower()
+    for h in os.getenv("PROXY_ALLOWED_HOSTS", "images.unsplash.com").split(",")
+    if h.strip()
+)
+_ALLOWED_SCHEMES = frozenset({"http", "https"})
+
+
+_ALLOWED_PORTS = frozenset({None, 80, 443})
+
+
+def _is_allowed_url(url) -> bool:
+    parts = urlsplit(str(url))
+    try:
+        port = parts.port
+    except ValueError:
+        return False
+    return (
+        parts.scheme in _ALLOWED_SCHEMES
+        and (parts.hostname or "") in _ALLOWED_HOSTS
+        and port in _ALLOWED_PORTS
+    )
+
+
+async def _check_upstream_host(request: httpx.Request):
+    """Refuse redirects that would leave the allowlist"""
+    if not _is_allowed_url(request.url):
+        raise httpx.RequestError(f"Host not allowed: {request.url.host}", request=request)
+
+
+# Shared client so upstream connections are pooled and kept alive across requests
+_http_client = httpx.AsyncClient(
+    timeout=10,
+    # Room for bursts of concurrent image fetches while keeping warm TLS connections
+    limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30),
+    follow_redirects=True,
+    event_hooks={"request": [_check_upstream_host]},
+    headers={
+        "User-Agent": "momtobe-proxy/1.0 (+https://example.com)",
+        "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
+        # Images are already compressed, so ask upstream not to encode them again
+        "Accept-Encoding": "identity",
+        "Referer": "",
+    },
+)
+
+
+@app.on_event("shutdown")
+async def close_http_client():
+    await _http_client.aclose()
+
+
+# Upstream Cache-Control directives that forbid keeping a shared copy
+_NO_SHARED_CACHE = re.compile(r"\b(no-store|private)\b", re.IGNORECASE)
+
+_PROXY_HEADERS = {
+    "Cache-Control": f"public, max-age={image_cache.MAX_AGE}",
+    "Access-Control-Allow-Origin": "*",
+}
+
+
+def _proxy_headers(meta: dict) -> dict:
+    """Caching headers plus the upstream validators so browsers revalidate"""
+    headers = dict(_PROXY_HEADERS)
+    if meta.get("etag"):
+        headers["ETag"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["Last-Modified"] = meta["last_modified"]
+    return headers
+
+
+def _is_not_modified(request: Request, meta: dict) -> bool:
+    """Evaluate the client's conditional headers against cached validators"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        etag = meta.get("etag")
+        if not etag:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison, as required for If-None-Match
+        tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+        return etag.removeprefix("W/") in tags
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and meta.get("last_modified"):
+        try:
+            return parsedate_to_datetime(meta["last_modified"]) <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
 
 
 @app.get("/api/proxy-image")
-def proxy_image(url: str = Query(..., description="Absolute image URL to proxy")):
+async def proxy_image(request: Request, url: str = Query(..., description="Absolute image URL to proxy")):
     """Proxy external images to avoid hotlink protection, CORS/referrer issues.
-    Adds simple caching headers.
+    Serves repeat requests from the image cache, forwards upstream validators
+    and answers conditional requests with 304 Not Modified.
     """
+    # Reject before any DNS lookup or connect to an arbitrary host
+    if not _is_allowed_url(url):
+        raise HTTPException(status_code=400, detail="Invalid URL")
+
+    key = image_cache.cache_key(url)
+    cached = await image_cache.get(key)
+    if cached is not None:
+        meta, body, path = cached
+        headers = _proxy_headers(meta)
+        if _is_not_modified(request, meta):
+            return Response(status_code=304, headers=headers)
+        if body is not None:
+            return Response(content=body, media_type=meta["content_type"], headers=headers)
+        # Not FileResponse: it would add stat-based validators that
+        # _is_not_modified can't honour
+        return StreamingResponse(
+            image_cache.iter_file(path), media_type=meta["content_type"], headers=headers
+        )
+
+    # Pass the client's validators upstream so an unchanged image costs no body transfer
+    conditional = {
+        name: request.headers[name]
+        for name in ("if-none-match", "if-modified-since")
+        if name in request.headers
+    }
     try:
-        if not (url.startswith("http://") or url.startswith("https://")):
-            raise HTTPException(status_code=400, detail="Invalid URL")
-        # Fetch the image
-        resp = requests.get(url, stream=True, timeout=10, headers={
-            "User-Agent": "momtobe-proxy/1.0 (+https://example.com)",
-            "Accept": "image/avif,image/webp,image/apng,image/*,*/*;q=0.8",
-            "Referer": ""
-        })
-        content_type = resp.headers.get("Content-Type", "image/jpeg")
-        if not resp.ok:
-            raise HTTPException(status_code=404, detail="Image not found")
-
-        def iter_content():
-            for chunk in resp.iter_content(chunk_size=8192):
-                if chunk:
-                    yield chunk
-        headers = {
-            "Cache-Control": "public, max-age=86400",
-            "Access-Control-Allow-Origin": "*",
-        }
-        return StreamingResponse(iter_content(), media_type=content_type, headers=headers)
-    except HTTPException:
-        raise
+        resp = await _http_client.send(
+            _http_client.build_request("GET", url, headers=conditional), stream=True
+        )
     except Exception as e:
         return Response(status_code=502, content=str(e))
+    if resp.is_error:
+        await resp.aclose()
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    content_type = resp.headers.get("Content-Type", "image/jpeg")
+    meta = {
+        "content_type": content_type,
+        "etag": resp.headers.get("ETag"),
+        "last_modified": resp.headers.get("Last-Modified"),
+    }
+    headers = _proxy_headers(meta)
+    if resp.status_code == 304:
+        await resp.aclose()
+        return Response(status_code=304, headers=headers)
+
+    # Only plain 200s the upstream lets shared caches keep go into either tier
+    upstream_cache_control = resp.headers.get("Cache-Control", "")
+    cacheable = resp.status_code == 200 and not _NO_SHARED_CACHE.search(upstream_cache_control)
+    if not cacheable and upstream_cache_control:
+        # Don't advertise a public max-age for something we refused to cache
+        headers["Cache-Control"] = upstream_cache_control
+
+    length = resp.headers.get("Content-Length")
+    known_length = int(length) if length and length.isdigit() else None
+    if cacheable and known_length is not None and known_length <= image_cache.MEMORY_MAX_ITEM_BYTES:
+        # Small image: read it whole and keep it in memory
+        try:
+            body = await resp.aread()
+        except Exception as e:
+            return Response(status_code=502, content=str(e))
+        finally:
+            await resp.aclose()
+        image_cache.put(key, body, meta)
+        return Response(content=body, media_type=content_type, headers=headers)
+
+    # Large images are teed to disk; anything that won't be cached is handed
+    # to Starlette as the upstream iterator with no Python wrapper per chunk.
+    # aiter_bytes decodes any Content-Encoding an upstream sends regardless,
+    # so clients and the cache always get the plain image
+    if known_length is not None and known_length > image_cache.DISK_MAX_ITEM_BYTES:
+        cacheable = False
+    writer = image_cache.DiskWriter(key, meta) if cacheable else None
+    if writer is None or not await writer.open():
+        return StreamingResponse(
+            resp.aiter_bytes(65536),
+            media_type=content_type,
+            headers=headers,
+            background=BackgroundTask(resp.aclose),
+        )
+
+    async def stream_and_cache():
+        try:
+            async for chunk in resp.aiter_bytes(65536):
+                await writer.write(chunk)
+                yield chunk
+            await writer.commit()
+        finally:
+            await writer.close()
+
+    return StreamingResponse(
+        stream_and_cache(),
+        media_type=content_type,
+        headers=headers,
+        background=BackgroundTask(resp.aclose),
+    )
+
+
+# Environment is read once; health checkers may poll /test frequently
+_DATABASE_URL_STATUS = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
+_DATABASE_NAME_STATUS = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+
+_COLLECTIONS_TTL = 10.0
+# (fetched_at, collection names) from the last successful listing
+_collections_cache = (0.0, [])
+
+
+def _list_collections():
+    """Collection names, refreshed from the server at most every _COLLECTIONS_TTL seconds"""
+    global _collections_cache
+    fetched_at, names = _collections_cache
+    now = time.monotonic()
+    if fetched_at and now - fetched_at < _COLLECTIONS_TTL:
+        return names
+    names = db.list_collection_names()
+    _collections_cache = (now, names)
+    return names
+
+
+# Without a configured database the /test report never changes
+_TEST_NO_DB_BODY = orjson.dumps({
+    "backend": "✅ Running",
+    "database": "⚠️  Available but not initialized",
+    "database_url": _DATABASE_URL_STATUS,
+    "database_name": _DATABASE_NAME_STATUS,
+    "connection_status": "Not Connected",
+    "collections": [],
+})
 
 
 @app.get("/test")
 def test_database():
     """Test endpoint to check if database is available and accessible"""
+    if db is None:
+        return Response(content=_TEST_NO_DB_BODY, media_type="application/json")
     response = {
         "backend": "✅ Running",
-        "database": "❌ Not Available",
-        "database_url": None,
-        "database_name": None,
-        "connection_status": "Not Connected",
+        "database": "✅ Available",
+        "database_url": _DATABASE_URL_STATUS,
+        "database_name": _DATABASE_NAME_STATUS,
+        "connection_status": "Connected",
         "collections": []
     }
     try:
-        if db is not None:
-            response["database"] = "✅ Available"
-            response["database_url"] = "✅ Configured"
-            response["database_name"] = db.name if hasattr(db, 'name') else "✅ Connected"
-            response["connection_status"] = "Connected"
-            try:
-                collections = db.list_collection_names()
-                response["collections"] = collections[:10]
-                response["database"] = "✅ Connected & Working"
-            except Exception as e:
-                response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
-        else:
-            response["database"] = "⚠️  Available but not initialized"
+        collections = _list_collections()
+        response["collections"] = collections[:10]
+        response["database"] = "✅ Connected & Working"
     except Exception as e:
-        response["database"] = f"❌ Error: {str(e)[:50]}"
-
-    response["database_url"] = "✅ Set" if os.getenv("DATABASE_URL") else "❌ Not Set"
-    response["database_name"] = "✅ Set" if os.getenv("DATABASE_NAME") else "❌ Not Set"
+        response["database"] = f"⚠️  Connected but Error: {str(e)[:50]}"
     return response
 
 
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
+    workers = int(os.getenv("WEB_CONCURRENCY", (os.cpu_count() or 1) * 2 + 1))
+    # Import string rather than the app object so uvicorn can spawn workers
+    uvicorn.run(
+        "main:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop="uvloop",
+        http="httptools",
+    )
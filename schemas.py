@@ -9,6 +9,9 @@ Model name is converted to lowercase for the collection name:
 - User -> "user" collection
 - Product -> "product" collection
 - BlogPost -> "blogs" collection
+
+Models intentionally keep Pydantic's default config: extra keys (such as the
+stored created_at/updated_at timestamps) are already ignored by default.
 """
 
 from pydantic import BaseModel, Field, EmailStr